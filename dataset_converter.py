@@ -24,6 +24,9 @@ from record_msg.builder import (
   IMUBuilder,
   GnssBestPoseBuilder)
 from kaist_urban_complex import KUCSchema, KUC
+from multiprocessing import Pool
+import numpy as np
+import heapq
 import sys
 
 LOCALIZATION_TOPIC = '/apollo/localization/pose'
@@ -67,23 +70,100 @@ def dataset_to_record(kuc, record_root_path):
         raise "Not implemented yet."
       record.write(channel_name, pb_msg, t)
 
-def convert_dataset(dataset_path, record_path, version_info, lidar_mode=1):
+def shard_windows(timestamps, shard_seconds=None, shard_messages=None):
+  """Split the sorted timestamps into half-open [start, end) time windows
+
+  Windows are cut at message timestamps, so every message falls into exactly
+  one shard and messages sharing a timestamp are never split. Empty windows
+  are dropped. Exactly one of shard_seconds and shard_messages has to be set.
+
+  Args:
+      timestamps (np.ndarray): sorted message timestamps (ns)
+      shard_seconds (float, optional): max time span of a shard
+      shard_messages (int, optional): max number of messages of a shard. A
+        single timestamp carrying more messages than that still forms one shard.
+
+  Returns:
+      list: (start, end) pairs in ns
+  """
+  assert (shard_seconds is None) != (shard_messages is None), \
+    "Exactly one of shard_seconds and shard_messages has to be set"
+  if len(timestamps) == 0:
+    return []
+  if shard_seconds is not None:
+    step = int(shard_seconds * 1e9)
+    assert step > 0, "shard_seconds has to be positive"
+    shard_ids = (timestamps - timestamps[0]) // step
+    starts = timestamps[0] + np.unique(shard_ids) * step
+    return [(int(start), int(start + step)) for start in starts]
+
+  assert shard_messages > 0, "shard_messages has to be positive"
+  stamps, counts = np.unique(timestamps, return_counts=True)
+  # cumulative[i]: number of messages before stamps[i]
+  cumulative = np.concatenate(([0], np.cumsum(counts)))
+  windows = []
+  i = 0
+  while i < len(stamps):
+    # take as many whole timestamps as fit, but at least one
+    j = np.searchsorted(cumulative, cumulative[i] + shard_messages, side='right') - 1
+    j = max(j, i + 1)
+    end = stamps[j] if j < len(stamps) else stamps[-1] + 1
+    windows.append((int(stamps[i]), int(end)))
+    i = j
+  return windows
+
+def _convert_shard(sensor_data_lists, record_path):
+  messages = heapq.merge(*sensor_data_lists, key=lambda x: x.timestamp)
+  dataset_to_record(messages, record_path)
+  return record_path
+
+def convert_dataset(dataset_path, record_path, version_info, lidar_mode=1,
+                    shard_seconds=None, shard_messages=None, num_workers=None):
   """Generate apollo record file by KITTI dataset
 
+  If shard_seconds or shard_messages is given, the output is split into
+  several records named '{record_path}.00000', '{record_path}.00001', ...
+  and each one is written by its own worker process. The dataset is loaded
+  once and every worker receives only the messages of its own shard.
+  shard_seconds and shard_messages are mutually exclusive.
+
   Args:
       dataset_path (str): KAIST dataset path
       record_path (str): record file saved path
+      shard_seconds (float, optional): split records every shard_seconds
+      shard_messages (int, optional): split records every shard_messages messages
+      num_workers (int, optional): number of worker processes, cpu count by default
   """
+  assert shard_seconds is None or shard_messages is None, \
+    "shard_seconds and shard_messages can not be set at the same time"
   kuc_schema = KUCSchema(dataroot=dataset_path)
   kuc = KUC(kuc_schema, ['vlp', 'imu', 'vrs_gps'], version_info, lidar_mode=lidar_mode)
 
   print("Start to convert scene, Pls wait!")
-  dataset_to_record(kuc, record_path)
-  print("Success! Records saved in '{}'".format(record_path))
+  if shard_seconds is None and shard_messages is None:
+    dataset_to_record(kuc, record_path)
+    print("Success! Records saved in '{}'".format(record_path))
+    return
+
+  windows = shard_windows(kuc.timestamps(), shard_seconds, shard_messages)
+  tasks = [(kuc.time_slice(start, end), f'{record_path}.{i:05d}')
+           for i, (start, end) in enumerate(windows)]
+  with Pool(num_workers) as pool:
+    shard_paths = pool.starmap(_convert_shard, tasks)
+  print("Success! {} records saved in '{}.*'".format(len(shard_paths), record_path))
 
 if __name__ == '__main__':
+  import argparse
   from dataset_config import version_info
-  datasets_root = sys.argv[1]
-  dataset_name = sys.argv[2]
-  output = sys.argv[3]
-  convert_dataset(f'{datasets_root}/{dataset_name}', output, version_info[dataset_name], lidar_mode=1)
\ No newline at end of file
+  parser = argparse.ArgumentParser(description='Convert a KAIST Urban Complex sequence to apollo record')
+  parser.add_argument('datasets_root', help='folder containing the sequences')
+  parser.add_argument('dataset_name', help='sequence name, e.g. urban06')
+  parser.add_argument('output', help='record file path, shards get a .NNNNN suffix')
+  shard_group = parser.add_mutually_exclusive_group()
+  shard_group.add_argument('--shard-seconds', type=float, help='split records every N seconds')
+  shard_group.add_argument('--shard-messages', type=int, help='split records every N messages')
+  parser.add_argument('--num-workers', type=int, help='worker processes for sharded output, cpu count by default')
+  args = parser.parse_args()
+  convert_dataset(f'{args.datasets_root}/{args.dataset_name}', args.output, version_info[args.dataset_name],
+                  lidar_mode=1, shard_seconds=args.shard_seconds, shard_messages=args.shard_messages,
+                  num_workers=args.num_workers)
@@ -151,3 +151,30 @@ class KUC(object):
             self.sensor_data_lists.append(data)
     # sort by timestamp
     self.sensor_data = heapq.merge(*self.sensor_data_lists, key=lambda x: x.timestamp)
+
+  def timestamps(self):
+    """All message timestamps (ns), sorted"""
+    stamps = [sensor.timestamp for data in self.sensor_data_lists for sensor in data]
+    return np.sort(np.array(stamps, dtype=np.int64))
+
+  def time_slice(self, start_time, end_time):
+    """Sensor data lists restricted to the messages in [start_time, end_time)
+
+    Every sensor data list is already sorted by timestamp, so each one is cut
+    with a binary search instead of rebuilding the messages.
+
+    Args:
+        start_time (int): window start (ns), inclusive
+        end_time (int): window end (ns), exclusive
+
+    Returns:
+        list: sliced sensor data lists, in the order of sensor_data_lists
+    """
+    if not hasattr(self, '_stamp_arrays'):
+      self._stamp_arrays = [np.array([sensor.timestamp for sensor in data], dtype=np.int64) \
+                            for data in self.sensor_data_lists]
+    sliced = []
+    for data, stamps in zip(self.sensor_data_lists, self._stamp_arrays):
+      lo, hi = np.searchsorted(stamps, [start_time, end_time])
+      sliced.append(data[lo:hi])
+    return sliced